@@ -1,66 +1,299 @@
-from typing import Dict, Any, Optional, List, Generator
+from typing import Dict, Any, Optional, List, Generator, Iterable, Iterator, Tuple, Callable
+from concurrent.futures import Executor
 import os
-import uuid
 import time
-import json
-import re
-from concurrent.futures import ThreadPoolExecutor
-
-from flask import Blueprint, request, jsonify, Response
-
+import queue
+import secrets
+import itertools
+import threading
+from functools import lru_cache, partial
+
+import fastjsonschema
+import orjson
+from flask import Blueprint, request, Response
+from werkzeug.wsgi import ClosingIterator
+
+from ..models.config import QueryRewriteConfig, ResponseCacheConfig
 from ..services.config_manager import ConfigurationManager
+from ..services.executor import BoundedExecutor, BusyError
+from ..services.pipeline import PipelineService, PromptMessage
+from ..services.response_cache import ResponseCache
+from ..services.vector_db import VectorDBService
+from .sse import chunk_prefix, encode_chunks
 
 
 api_bp = Blueprint("api", __name__)
 
-configuration_manager: Optional[ConfigurationManager] = None
-_executor: Optional[ThreadPoolExecutor] = None
+# Completion ids only need to be unique, not unpredictable: a per-process random
+# nonce plus a counter (itertools.count is atomic under the GIL)
+_ID_NONCE = secrets.token_hex(2)
+_id_counter = itertools.count()
 
+# Max pipeline output pieces buffered between the worker thread and a slow client
+_STREAM_QUEUE_SIZE = 32
 
-def init_configuration_manager(config_manager: ConfigurationManager, max_workers: int | None = None):
-    global configuration_manager, _executor
+configuration_manager: Optional[ConfigurationManager] = None
+_executor: Optional[BoundedExecutor] = None
+# Runs the vector search when set, instead of _executor; see init_configuration_manager
+_search_executor: Optional[Executor] = None
+# /v1/models body, fixed for the lifetime of the configuration manager
+_models_json: Optional[bytes] = None
+# Coalesce SSE chunks up to this many bytes per write
+_sse_flush_bytes: int = 4096
+# Final responses of exact repeat requests; None when disabled
+_response_cache: Optional[ResponseCache] = None
+
+# Compiled once at import; fills in defaults for "stream" and "model". JSON Schema
+# cannot address the last array item, so its role is still checked in the handler
+_validate_request = fastjsonschema.compile(
+    {
+        "type": "object",
+        "required": ["messages"],
+        "properties": {
+            "messages": {
+                "type": "array",
+                "minItems": 1,
+                "items": {
+                    "type": "object",
+                    "required": ["role"],
+                    "properties": {"role": {"type": "string"}},
+                },
+            },
+            # OpenAI allows an explicit null, meaning not streamed
+            "stream": {"type": ["boolean", "null"], "default": False},
+            "model": {"type": "string", "default": "default"},
+        },
+    }
+)
+
+# Client-facing messages for schema violations, by the offending part of the body
+_REQUEST_ERRORS = {
+    "body": "Request body must be a JSON object",
+    "messages": "'messages' is required and must be non-empty",
+    "role": "Every message must be an object with a string 'role'",
+    "stream": "'stream' must be a boolean or null",
+    "model": "'model' must be a string",
+}
+
+
+def _request_error(e: fastjsonschema.JsonSchemaValueException) -> str:
+    """Map a validator error (e.name is its path, e.g. data.messages[0].role) to a message"""
+    path = e.name.removeprefix("data")
+    if not path:
+        return _REQUEST_ERRORS["messages" if e.rule == "required" else "body"]
+    if path.startswith(".messages["):
+        return _REQUEST_ERRORS["role"]
+    return _REQUEST_ERRORS[path[1:]]
+
+
+def init_configuration_manager(
+    config_manager: ConfigurationManager,
+    max_workers: int | None = None,
+    sse_flush_bytes: int = 4096,
+    response_cache_config: Optional[ResponseCacheConfig] = None,
+    search_executor: Optional[Executor] = None,
+):
+    """Install the configuration manager and the request-handling settings
+
+    search_executor is for servers whose executor threads are not OS threads (gevent
+    greenlets): Chroma, sqlite and numpy block in C without yielding, so the vector
+    search has to run on real threads there to keep the other requests moving.
+    """
+    global configuration_manager, _executor, _models_json, _sse_flush_bytes, _response_cache
+    global _search_executor
     configuration_manager = config_manager
+    _search_executor = search_executor
+    _sse_flush_bytes = sse_flush_bytes
+    _response_cache = None
+    if response_cache_config is not None and response_cache_config.enabled:
+        _response_cache = ResponseCache(max_entries=response_cache_config.max_entries)
+    _services_for.cache_clear()
+    _models_json = orjson.dumps(
+        {
+            "object": "list",
+            "data": [
+                {"id": model_name, "object": "model", "created": 0, "owned_by": "rag-backend"}
+                for model_name in configuration_manager.get_available_models()
+            ],
+        }
+    )
     # Initialize executor lazily with configured workers (fallback to env for backwards compatibility)
     if _executor is None:
         if max_workers is None and configuration_manager is not None:
             max_workers = configuration_manager.config.server_config.pipeline_max_workers
         if max_workers is None:  # final fallback
             max_workers = int(os.getenv("PIPELINE_MAX_WORKERS", "4"))
-        _executor = ThreadPoolExecutor(max_workers=max_workers)
+        _executor = BoundedExecutor(max_workers=max_workers)
+
+
+# Only called for names that passed has_configuration, so the cache is bounded
+# by the number of configurations
+@lru_cache(maxsize=None)
+def _services_for(
+    model: str,
+) -> Tuple[Optional[VectorDBService], Optional[PipelineService], Optional[QueryRewriteConfig]]:
+    """Resolve the services of a model configuration once per model name"""
+    # The cache is cleared whenever a new configuration manager is installed
+    assert configuration_manager is not None, "init_configuration_manager() must run first"
+    return (
+        configuration_manager.get_vector_db_service(model),
+        configuration_manager.get_pipeline_service(model),
+        configuration_manager.get_query_rewrite_config(model),
+    )
+
+
+def _gen_completion_id() -> str:
+    return f"chatcmpl-{_ID_NONCE}{next(_id_counter):06x}"
+
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    """Serialize payload with orjson into an application/json response"""
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
 
 
 def _error(message: str, status: int):
-    return jsonify({"error": {"message": message, "type": "invalid_request_error"}}), status
+    return json_response({"error": {"message": message, "type": "invalid_request_error"}}, status)
+
+
+class _PipelineBatches:
+    """Iterator over the batches of a pipeline worker
+
+    close() stops the worker even if iteration never started: closing a generator
+    that was never started does not run its finally block.
+    """
+
+    def __init__(self, batches: Generator[List[str], None, None], cancelled: threading.Event):
+        self._batches = batches
+        self._cancelled = cancelled
+
+    def __iter__(self) -> "_PipelineBatches":
+        return self
+
+    def __next__(self) -> List[str]:
+        return next(self._batches)
+
+    def close(self) -> None:
+        self._cancelled.set()
+        self._batches.close()
+
+
+def _stream_pipeline(
+    pipeline_service: PipelineService,
+    messages: List[Dict[str, Any]],
+    context: str,
+    history: List[PromptMessage],
+    on_complete: Optional[Callable[[str], None]] = None,
+) -> Iterator[List[str]]:
+    """Run the pipeline on the executor and iterate its output as it is produced
+
+    Each step yields every piece that is ready at that moment, so a burst of tokens
+    can be written out at once while a lone token is still forwarded immediately.
+    The worker feeds a bounded queue: None marks the end of the stream and an exception
+    is re-raised on the consuming side. Closing the iterator (e.g. the client went away,
+    also before the first read) makes the worker stop at its next put instead of
+    blocking on a full queue.
+    on_complete receives the full text once the pipeline finished successfully.
+    """
+    pieces: "queue.Queue[Any]" = queue.Queue(maxsize=_STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not cancelled.is_set():
+            try:
+                pieces.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        produced: List[str] = []
+        try:
+            for piece in pipeline_service.run_pipeline_stream(messages, context, history):
+                if not put(piece):
+                    return
+                produced.append(piece)
+            if on_complete is not None:
+                on_complete("".join(produced))
+        except Exception as e:  # noqa: BLE001
+            put(e)
+            return
+        put(None)
+
+    assert _executor is not None, "init_configuration_manager() must run first"
+    _executor.submit(produce)
+
+    def consume() -> Generator[List[str], None, None]:
+        try:
+            done = False
+            while not done:
+                # Block for the next piece, then take whatever else is already queued
+                batch: List[str] = []
+                item = pieces.get()
+                while True:
+                    if item is None:
+                        done = True
+                        break
+                    if isinstance(item, Exception):
+                        if batch:
+                            yield batch
+                        raise item
+                    batch.append(item)
+                    try:
+                        item = pieces.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    yield batch
+        finally:
+            cancelled.set()
+
+    return _PipelineBatches(consume(), cancelled)
 
 
 @api_bp.route("/v1/chat/completions", methods=["POST", "OPTIONS"])
 def chat_completions():
     if request.method == "OPTIONS":
-        # CORS preflight; Flask-CORS will fill headers
+        # CORS preflight; headers are filled by the app-level CORS hook
         return ("", 204)
 
     if configuration_manager is None or _executor is None:
         return _error("Server not initialized", 500)
 
-    try:
-        data = request.get_json(silent=True) or {}
-        messages: List[Dict[str, Any]] = data.get("messages", [])
-        stream: bool = bool(data.get("stream", False))
-        model: str = data.get("model", "default")
+    now = int(time.time())
+    completion_id = _gen_completion_id()
 
-        if not messages:
-            return _error("'messages' is required and must be non-empty", 400)
+    try:
+        try:
+            data = _validate_request(request.get_json(silent=True) or {})
+        except fastjsonschema.JsonSchemaValueException as e:
+            return _error(_request_error(e), 400)
+        messages: List[Dict[str, Any]] = data["messages"]
+        stream: bool = data["stream"] or False
+        model: str = data["model"]
 
         if not configuration_manager.has_configuration(model):
             return _error(f"Unknown model configuration '{model}'", 400)
 
         last_message = messages[-1]
-        if last_message.get("role") != "user":
+        if last_message["role"] != "user":
             return _error("Last message must have role 'user'", 400)
 
-        vector_db_service = configuration_manager.get_vector_db_service(model)
-        pipeline_service = configuration_manager.get_pipeline_service(model)
-        query_rewrite_config = configuration_manager.get_query_rewrite_config(model)
+        cache_key = None
+        if _response_cache is not None:
+            # Exact repeats skip retrieval and the whole pipeline
+            cache_key = _response_cache.key(model, messages)
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                if stream:
+                    return create_stream_response(
+                        iter([[cached]]), model=model, completion_id=completion_id, created=now
+                    )
+                return create_completion_response(
+                    cached, model=model, completion_id=completion_id, created=now
+                )
+
+        vector_db_service, pipeline_service, query_rewrite_config = _services_for(model)
         if vector_db_service is None or pipeline_service is None:
             return _error("Configuration services not available", 500)
 
@@ -69,81 +302,47 @@ def chat_completions():
         if query_rewrite_config and query_rewrite_config.enabled:
             query = pipeline_service.rewrite_query(messages, query_rewrite_config)
 
-        # Vector search (can be blocking; acceptable per requirements)
-        context = vector_db_service.get_context(query)
-
-        # Run pipeline concurrently so multiple requests can progress in parallel
-        future = _executor.submit(pipeline_service.run_pipeline, messages, context)
+        # Vector search runs on the executor while this thread prepares the prompt history
+        context_future = (_search_executor or _executor).submit(vector_db_service.get_context, query)
+        history = pipeline_service.build_history(messages)
+        context = context_future.result()
 
         if stream:
-            # Build streaming response once future completes; we still offload heavy work
-            def generate() -> Generator[str, None, None]:
-                try:
-                    content = future.result()
-                    completion_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
-                    created = int(time.time())
-                    model_name = model
-
-                    tokens = re.split(r"(\s+)", content)
-                    tokens = [t for t in tokens if t]
-
-                    for token in tokens:
-                        chunk = {
-                            "id": completion_id,
-                            "object": "chat.completion.chunk",
-                            "created": created,
-                            "model": model_name,
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {"content": token},
-                                    "finish_reason": None,
-                                }
-                            ],
-                        }
-                        yield f"data: {json.dumps(chunk)}\n\n"
-
-                    final_chunk = {
-                        "id": completion_id,
-                        "object": "chat.completion.chunk",
-                        "created": created,
-                        "model": model_name,
-                        "choices": [
-                            {"index": 0, "delta": {}, "finish_reason": "stop"}
-                        ],
-                    }
-                    yield f"data: {json.dumps(final_chunk)}\n\n"
-                    yield "data: [DONE]\n\n"
-                except Exception as e:  # noqa: BLE001
-                    err_chunk = {"error": str(e)}
-                    yield f"data: {json.dumps(err_chunk)}\n\n"
-                    yield "data: [DONE]\n\n"
-
-            return Response(
-                generate(),
-                mimetype="text/event-stream",
-                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            # Pipeline runs on the executor; output is forwarded as soon as it is generated
+            on_complete = None
+            if cache_key is not None:
+                on_complete = partial(_response_cache.put, cache_key)
+            tokens = _stream_pipeline(
+                pipeline_service, messages, context, history, on_complete=on_complete
+            )
+            return create_stream_response(
+                tokens, model=model, completion_id=completion_id, created=now
             )
         else:
+            # Run pipeline concurrently so multiple requests can progress in parallel
+            future = _executor.submit(pipeline_service.run_pipeline, messages, context, history)
             content = future.result()
-            return create_completion_response(content, data)
+            if cache_key is not None:
+                _response_cache.put(cache_key, content)
+            return create_completion_response(
+                content, model=model, completion_id=completion_id, created=now
+            )
 
+    except BusyError:
+        return _error("Server busy", 503)
     except Exception as e:  # noqa: BLE001
         return _error(str(e), 500)
 
 
 def create_completion_response(
-    content: str, original_request: Dict[str, Any]
+    content: str, *, model: str, completion_id: str, created: int
 ) -> Response:
-    completion_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
-    created = int(time.time())
-
-    return jsonify(
+    return json_response(
         {
             "id": completion_id,
             "object": "chat.completion",
             "created": created,
-            "model": original_request.get("model", "rag-backend"),
+            "model": model,
             "choices": [
                 {
                     "index": 0,
@@ -156,30 +355,64 @@ def create_completion_response(
     )
 
 
+def create_stream_response(
+    tokens: Iterator[List[str]], *, model: str, completion_id: str, created: int
+) -> Response:
+    """Stream batches of content pieces as chat.completion.chunk server-sent events"""
+
+    def generate() -> Generator[bytes, None, None]:
+        try:
+            # Every token chunk shares the same envelope; build it once and only
+            # serialize the tokens themselves. Each batch of ready tokens goes out in
+            # as few writes as possible instead of one tiny write per token
+            prefix = chunk_prefix(completion_id, created, model)
+            flush_bytes = _sse_flush_bytes
+            for batch in tokens:
+                yield from encode_chunks(prefix, batch, flush_bytes)
+
+            final_chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": {}, "finish_reason": "stop"}
+                ],
+            }
+            yield b"data: " + orjson.dumps(final_chunk) + b"\n\ndata: [DONE]\n\n"
+        except Exception as e:  # noqa: BLE001
+            err_chunk = {"error": str(e)}
+            yield b"data: " + orjson.dumps(err_chunk) + b"\n\n"
+            yield b"data: [DONE]\n\n"
+
+    body: Iterable[bytes] = generate()
+    close = getattr(tokens, "close", None)
+    if close is not None:
+        # The server closes the body it was given (passed through unwrapped below), so
+        # the token source is closed from there, even if the body was never iterated
+        body = ClosingIterator(body, close)
+
+    resp = Response(
+        body,
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            # Keep proxies/middleware from buffering the stream to compress it
+            "Content-Encoding": "identity",
+        },
+    )
+    # Chunks are already bytes; hand the generator to the server unwrapped
+    resp.direct_passthrough = True
+    return resp
+
+
 @api_bp.route("/v1/models", methods=["GET", "OPTIONS"])
 def list_models():
     if request.method == "OPTIONS":
         return ("", 204)
 
-    if configuration_manager is None:
+    if configuration_manager is None or _models_json is None:
         return _error("Server not initialized", 500)
 
-    available_models = configuration_manager.get_available_models()
-    model_data = []
-
-    for model_name in available_models:
-        model_data.append(
-            {
-                "id": model_name,
-                "object": "model",
-                "created": 0,
-                "owned_by": "rag-backend",
-            }
-        )
-
-    return jsonify(
-        {
-            "object": "list",
-            "data": model_data,
-        }
-    )
+    return Response(_models_json, mimetype="application/json")
@@ -0,0 +1,34 @@
+"""Server-sent event encoding for chat.completion.chunk streams
+
+Kept free of Flask imports and fully annotated so it can be compiled with mypyc
+(the optional wheel build hook in pyproject.toml). The compiled extension takes the
+place of this module under the same name; without it this runs as plain Python.
+"""
+from typing import Iterator, List
+
+import orjson
+
+CHUNK_SUFFIX = b'},"finish_reason":null}]}\n\n'
+
+
+def chunk_prefix(completion_id: str, created: int, model: str) -> bytes:
+    """Envelope shared by every token chunk of a stream, up to the content value"""
+    return (
+        b'data: {"id":%s,"object":"chat.completion.chunk","created":%d,'
+        b'"model":%s,"choices":[{"index":0,"delta":{"content":'
+        % (orjson.dumps(completion_id), created, orjson.dumps(model))
+    )
+
+
+def encode_chunks(prefix: bytes, tokens: List[str], flush_bytes: int) -> Iterator[bytes]:
+    """Encode tokens as chunk events, grouped into writes of about flush_bytes each"""
+    buf = bytearray()
+    for token in tokens:
+        buf += prefix
+        buf += orjson.dumps(token)
+        buf += CHUNK_SUFFIX
+        if len(buf) >= flush_bytes:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
@@ -1,50 +1,152 @@
 import os
-import json
+import sys
 import argparse
-from flask import Flask, jsonify
+from concurrent.futures import Executor
+from typing import Any, Optional
+
+import orjson
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_cors.core import probably_regex
 from dotenv import load_dotenv
 
-from .models.config import Config
+from .models.config import Config, CORSConfig
 from .services.config_manager import ConfigurationManager
-from .api.completions import api_bp, init_configuration_manager
+from .services.vector_db import VectorDBService
+from .api.completions import api_bp, init_configuration_manager, json_response
+
+
+# Environment variable carrying the full config as JSON from main() to gunicorn workers
+CONFIG_JSON_ENV = "RAG_BACKEND_CONFIG_JSON"
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (request.get_json, jsonify)"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
+def load_config(config_path: str) -> Config:
+    # Parsed and validated in one pass by pydantic-core, without an intermediate dict
+    with open(config_path, "rb") as f:
+        return Config.model_validate_json(f.read())
 
 
-def create_app(config_path: str = "config.json", reindex: bool = False) -> Flask:
+def _install_static_cors(app: Flask, cors_config: CORSConfig) -> None:
+    """Answer a single literal origin with precomputed CORS headers, skipping
+    Flask-CORS's per-request option resolution
+
+    As with Flask-CORS, headers are only sent to that origin, and the allowed
+    methods and headers only on preflight (OPTIONS) requests.
+    """
+    origin = cors_config.origins[0]
+    headers = {"Access-Control-Allow-Origin": origin}
+    if cors_config.supports_credentials:
+        headers["Access-Control-Allow-Credentials"] = "true"
+    preflight_headers = {
+        **headers,
+        "Access-Control-Allow-Methods": ", ".join(cors_config.methods),
+        "Access-Control-Allow-Headers": ", ".join(cors_config.headers),
+    }
+
+    @app.after_request
+    def add_cors_headers(response: Response) -> Response:
+        if request.headers.get("Origin") == origin:
+            response.headers.update(preflight_headers if request.method == "OPTIONS" else headers)
+        return response
+
+
+def create_app(
+    config_path: str = "config.json",
+    reindex: bool = False,
+    config: Optional[Config] = None,
+    search_executor: Optional[Executor] = None,
+) -> Flask:
+    """Build the Flask app; an already loaded config takes precedence over config_path
+
+    search_executor, when given, runs the vector searches (see init_configuration_manager).
+    """
     load_dotenv()
 
     if not os.getenv("VENICE_API_KEY"):
         raise ValueError("VENICE_API_KEY environment variable is required")
 
-    with open(config_path, "r") as f:
-        config_dict = json.load(f)
-
-    config = Config(**config_dict)
+    if config is None:
+        config = load_config(config_path)
 
     config_manager = ConfigurationManager(
         config=config, api_key=os.getenv("VENICE_API_KEY"), reindex=reindex
     )
-    init_configuration_manager(config_manager)
+    init_configuration_manager(
+        config_manager,
+        max_workers=config.server_config.pipeline_max_workers,
+        sse_flush_bytes=config.server_config.sse_flush_bytes,
+        response_cache_config=config.server_config.response_cache,
+        search_executor=search_executor,
+    )
 
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
     app.register_blueprint(api_bp)
 
     cors_config = config.server_config.cors
-    CORS(
-        app,
-        origins=cors_config.origins,
-        methods=cors_config.methods,
-        allow_headers=cors_config.headers,
-        supports_credentials=cors_config.supports_credentials,
-    )
+    # Anything Flask-CORS would match as a pattern (wildcards, regexes) stays with it
+    if len(cors_config.origins) == 1 and not probably_regex(cors_config.origins[0]):
+        _install_static_cors(app, cors_config)
+    else:
+        CORS(
+            app,
+            origins=cors_config.origins,
+            methods=cors_config.methods,
+            allow_headers=cors_config.headers,
+            supports_credentials=cors_config.supports_credentials,
+        )
 
     @app.route("/health", methods=["GET"])
     def health():  # noqa: D401
-        return jsonify({"status": "ok"})
+        return json_response({"status": "ok"})
 
     return app
 
 
+def _build_indexes(config: Config, reindex: bool = False) -> None:
+    """Create missing (or, with reindex, all) indexes before workers start loading them"""
+    for config_entry in config.configurations.values():
+        vector_db = VectorDBService(
+            config=config_entry.vector_db_config,
+            data_dir=config_entry.data_directory,
+        )
+        if reindex or not vector_db.index_exists():
+            vector_db.load_or_create_index(reindex=True)
+
+
+def _exec_gunicorn(config: Config) -> None:
+    """Replace this process with gunicorn serving wsgi.app on gevent workers"""
+    # Hand the workers the config with CLI overrides applied through the environment,
+    # which gunicorn inherits across the exec; nothing is left behind on disk
+    os.environ[CONFIG_JSON_ENV] = config.model_dump_json()
+
+    server_config = config.server_config
+    workers = server_config.workers or 2 * (os.cpu_count() or 1) + 1
+    host = f"[{server_config.host}]" if ":" in server_config.host else server_config.host
+    os.execv(
+        sys.executable,
+        [
+            sys.executable, "-m", "gunicorn",
+            "--worker-class", "gevent",
+            "--workers", str(workers),
+            "--worker-connections", "1000",
+            "--bind", f"{host}:{server_config.port}",
+            f"{__package__}.wsgi:app",
+        ],
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description="RAG Backend Server")
     parser.add_argument("--config", default="config.json", help="Path to config file")
@@ -80,6 +182,9 @@ def main():
     parser.add_argument(
         "--pipeline-max-workers", type=int, help="Override pipeline max worker threads"
     )
+    parser.add_argument(
+        "--workers", type=int, help="Override number of gunicorn worker processes"
+    )
 
     args = parser.parse_args()
 
@@ -88,10 +193,7 @@ def main():
     if not os.getenv("VENICE_API_KEY"):
         raise SystemExit("VENICE_API_KEY environment variable is required")
 
-    with open(args.config, "r") as f:
-        config_dict = json.load(f)
-
-    config = Config(**config_dict)
+    config = load_config(args.config)
 
     if args.host:
         config.server_config.host = args.host
@@ -121,35 +223,21 @@ def main():
 
     if args.pipeline_max_workers is not None:
         config.server_config.pipeline_max_workers = args.pipeline_max_workers
+    if args.workers is not None:
+        config.server_config.workers = args.workers
 
-    config_manager = ConfigurationManager(
-        config=config, api_key=os.getenv("VENICE_API_KEY"), reindex=args.reindex
-    )
-    init_configuration_manager(
-        config_manager, max_workers=config.server_config.pipeline_max_workers
-    )
-
-    app = Flask(__name__)
-    app.register_blueprint(api_bp)
+    if not config.server_config.debug:
+        # Index once here; every worker then just loads the persisted index
+        _build_indexes(config, reindex=args.reindex)
+        _exec_gunicorn(config)
 
-    cors_config = config.server_config.cors
-    CORS(
-        app,
-        origins=cors_config.origins,
-        methods=cors_config.methods,
-        allow_headers=cors_config.headers,
-        supports_credentials=cors_config.supports_credentials,
-    )
-
-    @app.route("/health", methods=["GET"])
-    def _health():
-        return jsonify({"status": "ok"})
+    # Debug mode: Werkzeug development server with reloader and debugger
+    app = create_app(config=config, reindex=args.reindex)
 
     app.run(
         host=config.server_config.host,
         port=config.server_config.port,
         debug=config.server_config.debug,
-        threaded=True,
     )
 
 
@@ -1,14 +1,20 @@
 from typing import Dict, List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
-class ModelConfig(BaseModel):
+class _ConfigModel(BaseModel):
+    # Validators are built on first use rather than at import; most models are only
+    # ever validated once, as part of loading Config
+    model_config = ConfigDict(defer_build=True)
+
+
+class ModelConfig(_ConfigModel):
     name: str = Field(description="Model name to use for Venice API")
     temperature: float = Field(default=0.7, ge=0, le=2)
     max_tokens: Optional[int] = Field(default=None)
 
 
-class PromptConfig(BaseModel):
+class PromptConfig(_ConfigModel):
     system_prompt: str = Field(description="System prompt for the model")
     user_prompt_template: str = Field(
         description="User prompt template, use {question} and {context} placeholders"
@@ -16,7 +22,7 @@ class PromptConfig(BaseModel):
     model: str = Field(description="Model ID to use from models config")
 
 
-class GatePromptConfig(BaseModel):
+class GatePromptConfig(_ConfigModel):
     name: str = Field(description="Name of the gate prompt")
     system_prompt: str = Field(description="System prompt for gate checking")
     user_prompt_template: str = Field(
@@ -26,7 +32,7 @@ class GatePromptConfig(BaseModel):
     fix_prompt: Optional["FixPromptConfig"] = None
 
 
-class FixPromptConfig(BaseModel):
+class FixPromptConfig(_ConfigModel):
     system_prompt: str = Field(description="System prompt for fixing responses")
     user_prompt_template: str = Field(
         description="Template for fixing, use {response} and {reject_reason} placeholders"
@@ -34,7 +40,7 @@ class FixPromptConfig(BaseModel):
     model: str = Field(description="Model ID to use from models config")
 
 
-class RewritePromptConfig(BaseModel):
+class RewritePromptConfig(_ConfigModel):
     name: str = Field(description="Name of the rewrite prompt")
     system_prompt: str = Field(description="System prompt for rewriting")
     user_prompt_template: str = Field(
@@ -43,7 +49,7 @@ class RewritePromptConfig(BaseModel):
     model: str = Field(description="Model ID to use from models config")
 
 
-class QueryRewriteConfig(BaseModel):
+class QueryRewriteConfig(_ConfigModel):
     """Configuration for context-aware query rewriting before vector search"""
     enabled: bool = Field(default=True, description="Enable query rewriting")
     system_prompt: str = Field(
@@ -72,14 +78,14 @@ Optimized search query:""",
     model: str = Field(description="Model ID to use from models config")
 
 
-class PipelineConfig(BaseModel):
+class PipelineConfig(_ConfigModel):
     main_prompt: PromptConfig
     gate_prompts: List[GatePromptConfig] = Field(default_factory=list)
     rewrite_prompts: List[RewritePromptConfig] = Field(default_factory=list)
     max_retries: int = Field(default=2, ge=1, le=10)
 
 
-class VectorDBConfig(BaseModel):
+class VectorDBConfig(_ConfigModel):
     collection_name: str = Field(default="rag_documents")
     embedding_model: str = Field(default="nomic-embed-text")
     ollama_base_url: str = Field(default="http://localhost:11434")
@@ -91,22 +97,39 @@ class VectorDBConfig(BaseModel):
     mmr_lambda: float = Field(default=0.5, ge=0.0, le=1.0, description="MMR lambda parameter (0=diversity, 1=relevance)")
 
 
-class CORSConfig(BaseModel):
+class CORSConfig(_ConfigModel):
     origins: List[str] = Field(default_factory=list, description="Allowed origins for CORS")
     methods: List[str] = Field(default=["GET", "POST", "PUT", "DELETE", "OPTIONS"], description="Allowed HTTP methods")
     headers: List[str] = Field(default=["Content-Type", "Authorization"], description="Allowed headers")
     supports_credentials: bool = Field(default=False, description="Allow credentials in CORS requests")
 
 
-class ServerConfig(BaseModel):
+class SemanticCacheConfig(_ConfigModel):
+    """In-process cache of retrieved contexts keyed by query embedding similarity"""
+    enabled: bool = Field(default=False, description="Reuse retrieved context for semantically similar queries")
+    similarity_threshold: float = Field(default=0.97, ge=0.0, le=1.0, description="Minimum cosine similarity for a cache hit")
+    capacity: int = Field(default=256, ge=1, description="Max cached queries per configuration (LRU eviction)")
+
+
+class ResponseCacheConfig(_ConfigModel):
+    """In-process cache of final responses for exact repeat requests"""
+    enabled: bool = Field(default=False, description="Answer exact repeat requests from the cache")
+    max_entries: int = Field(default=2048, ge=1, description="Max cached responses (LRU eviction)")
+
+
+class ServerConfig(_ConfigModel):
     host: str = Field(default="0.0.0.0", description="Host to bind to")
     port: int = Field(default=8080, ge=1, le=65535, description="Port to bind to")
     debug: bool = Field(default=False, description="Enable debug mode")
     cors: CORSConfig = Field(default_factory=CORSConfig, description="CORS configuration")
     pipeline_max_workers: int = Field(default=4, ge=1, le=64, description="Max concurrent pipeline worker threads")
+    sse_flush_bytes: int = Field(default=4096, ge=1, description="Coalesce streamed chunks up to this many bytes per write")
+    workers: Optional[int] = Field(default=None, ge=1, description="Gunicorn worker processes (default: 2 * CPU count + 1)")
+    semantic_cache: SemanticCacheConfig = Field(default_factory=SemanticCacheConfig, description="Semantic context cache configuration")
+    response_cache: ResponseCacheConfig = Field(default_factory=ResponseCacheConfig, description="Exact response cache configuration")
 
 
-class ConfigurationEntry(BaseModel):
+class ConfigurationEntry(_ConfigModel):
     """Configuration entry for a specific model/configuration"""
     data_directory: str = Field(default="data", description="Directory containing data files")
     vector_db_config: VectorDBConfig = Field(description="Vector database configuration")
@@ -114,7 +137,7 @@ class ConfigurationEntry(BaseModel):
     query_rewrite_config: Optional[QueryRewriteConfig] = Field(default=None, description="Query rewriting configuration for improved RAG search")
 
 
-class Config(BaseModel):
+class Config(_ConfigModel):
     # Global settings
     venice_api_base: str = Field(default="https://api.venice.ai/api/v1")
     server_config: ServerConfig = Field(default_factory=ServerConfig)
@@ -122,4 +145,3 @@ class Config(BaseModel):
 
     # Individual configurations by model name
     configurations: Dict[str, ConfigurationEntry] = Field(default_factory=dict, description="Model-specific configurations")
-GatePromptConfig.model_rebuild()
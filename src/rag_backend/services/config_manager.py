@@ -1,5 +1,7 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from ..models.config import Config, ConfigurationEntry, QueryRewriteConfig
 from .vector_db import VectorDBService
@@ -18,25 +20,49 @@ class ConfigurationManager:
         # Initialize all configurations
         self._initialize_configurations(reindex)
 
+    def _init_one(
+        self, config_entry: ConfigurationEntry, reindex: bool = False
+    ) -> Tuple[VectorDBService, PipelineService]:
+        """Build the vector DB (loading or creating its index) and pipeline services of one configuration"""
+        vector_db = VectorDBService(
+            config=config_entry.vector_db_config,
+            data_dir=config_entry.data_directory,
+            semantic_cache_config=self.config.server_config.semantic_cache,
+        )
+        vector_db.load_or_create_index(reindex=reindex)
+
+        pipeline = PipelineService(
+            config=config_entry.pipeline_config,
+            models=self.config.models,
+            api_key=self.api_key,
+            api_base=self.config.venice_api_base,
+            query_rewrite_config=config_entry.query_rewrite_config,
+        )
+        return vector_db, pipeline
+
     def _initialize_configurations(self, reindex: bool = False):
-        """Initialize vector DB and pipeline services for all configurations"""
-        for model_name, config_entry in self.config.configurations.items():
-            # Initialize vector DB service
-            vector_db = VectorDBService(
-                config=config_entry.vector_db_config,
-                data_dir=config_entry.data_directory,
-            )
-            vector_db.load_or_create_index(reindex=reindex)
-            self.vector_db_services[model_name] = vector_db
-
-            # Initialize pipeline service
-            pipeline = PipelineService(
-                config=config_entry.pipeline_config,
-                models=self.config.models,
-                api_key=self.api_key,
-                api_base=self.config.venice_api_base
-            )
-            self.pipeline_services[model_name] = pipeline
+        """Initialize vector DB and pipeline services for all configurations
+
+        Configurations are independent, so their index loading/embedding runs in
+        parallel and startup takes about as long as the slowest one.
+        """
+        entries = list(self.config.configurations.items())
+        if not entries:
+            return
+
+        lock = threading.Lock()
+
+        def init(model_name: str, config_entry: ConfigurationEntry) -> None:
+            vector_db, pipeline = self._init_one(config_entry, reindex)
+            with lock:
+                self.vector_db_services[model_name] = vector_db
+                self.pipeline_services[model_name] = pipeline
+
+        with ThreadPoolExecutor(max_workers=min(8, len(entries))) as executor:
+            futures = [executor.submit(init, model_name, config_entry) for model_name, config_entry in entries]
+            # Re-raise the first initialization error
+            for future in futures:
+                future.result()
 
     def get_vector_db_service(self, model_name: str) -> Optional[VectorDBService]:
         """Get vector DB service for a specific model configuration"""
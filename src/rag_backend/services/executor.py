@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class BusyError(RuntimeError):
+    """Raised by BoundedExecutor.submit when no more work can be accepted"""
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor that rejects work instead of queueing it without limit
+
+    At most ``max_pending`` tasks (running or waiting, default twice the worker count)
+    are accepted at a time; further submits fail fast with BusyError so bursts turn into
+    quick rejections rather than an ever-growing queue and tail latency.
+    """
+
+    def __init__(self, max_workers: int, max_pending: Optional[int] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending or max_workers * 2)
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise BusyError("Server busy")
+
+        def run() -> Any:
+            # Free the slot before the future resolves, so a caller woken by
+            # result() can immediately submit again
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(run)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release_if_cancelled)
+        return future
+
+    def _release_if_cancelled(self, future: Future) -> None:
+        # A task cancelled while still queued never runs, so give its slot back here
+        if future.cancelled():
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
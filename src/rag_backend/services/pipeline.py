@@ -1,7 +1,8 @@
-from typing import Optional, Tuple, Dict, List
+from typing import Optional, Tuple, Dict, List, Iterator
+from concurrent.futures import ThreadPoolExecutor
 
+import httpx
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage
 
 from ..models.config import (
     PipelineConfig,
@@ -13,45 +14,84 @@ from ..models.config import (
     QueryRewriteConfig,
 )
 
+# (role, content) pairs; chat models accept these in place of message objects
+PromptMessage = Tuple[str, str]
+
+# Roles carried over from the conversation history; anything else (e.g. tool) is dropped
+_HISTORY_ROLES = frozenset(("system", "user", "assistant"))
+
+# Connection pool shared by every ChatOpenAI client in the process, so keep-alive
+# connections to the API are reused across prompts, requests and configurations
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=16, max_connections=32)
+_http_client = httpx.Client(limits=_HTTP_LIMITS)
+
+# Passed to each ChatOpenAI, which sends it with every request (the http_client's own
+# timeout is never used). read bounds the wait for each piece of the response: a
+# non-streamed answer arrives in one piece once generation is done, so it gets far
+# longer than connecting and sending, but a hung upstream still frees its worker
+_HTTP_TIMEOUT = httpx.Timeout(60.0, read=300.0)
+
+# Gate checks of one response are independent and dispatched together; sized to the
+# connection pool since each worker holds at most one API connection
+_gate_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="gate")
+
 
 class PipelineService:
-    # Service is stateless across invocations (no shared mutable per-request state), safe for thread pool usage
-    def __init__(self, config: PipelineConfig, models: Dict[str, ModelConfig], api_key: str, api_base: str):
+    # No per-request state; the LLM clients are all built in __init__ and only read
+    # afterwards, so the service is safe for thread pool usage
+    def __init__(
+        self,
+        config: PipelineConfig,
+        models: Dict[str, ModelConfig],
+        api_key: str,
+        api_base: str,
+        query_rewrite_config: Optional[QueryRewriteConfig] = None,
+    ):
         self.config = config
         self.models = models
         self.api_key = api_key
         self.api_base = api_base
 
+        # Every referenced model must exist; fail at startup instead of mid-request
+        self._llm_cache: Dict[str, ChatOpenAI] = {
+            model_id: self._build_llm(self._get_model_config(model_id))
+            for model_id in self._referenced_models(query_rewrite_config)
+        }
+
+    def _referenced_models(self, query_rewrite_config: Optional[QueryRewriteConfig]) -> List[str]:
+        """Model ids used by any prompt of this pipeline, in first-use order"""
+        model_ids = [self.config.main_prompt.model]
+        for gate_config in self.config.gate_prompts:
+            model_ids.append(gate_config.model)
+            if gate_config.fix_prompt:
+                model_ids.append(gate_config.fix_prompt.model)
+        model_ids.extend(rewrite_config.model for rewrite_config in self.config.rewrite_prompts)
+        if query_rewrite_config is not None and query_rewrite_config.enabled:
+            model_ids.append(query_rewrite_config.model)
+        return list(dict.fromkeys(model_ids))
+
     def _get_model_config(self, model_id: str) -> ModelConfig:
-        if model_id not in self.models:
-            raise ValueError(f"Model '{model_id}' not found in models configuration")
-        return self.models[model_id]
+        try:
+            return self.models[model_id]
+        except KeyError:
+            raise ValueError(f"Model '{model_id}' not found in models configuration") from None
 
-    def _get_llm(self, model_id: str) -> ChatOpenAI:
-        model_config = self._get_model_config(model_id)
+    def _build_llm(self, model_config: ModelConfig) -> ChatOpenAI:
         return ChatOpenAI(
             model=model_config.name,
             temperature=model_config.temperature,
             max_tokens=model_config.max_tokens,
             openai_api_key=self.api_key,
             openai_api_base=self.api_base,
+            http_client=_http_client,
+            timeout=_HTTP_TIMEOUT,
         )
 
-    def _convert_messages_to_langchain(self, messages: List[Dict[str, str]]) -> List[BaseMessage]:
-        """Convert OpenAI format messages to LangChain format"""
-        langchain_messages = []
-        for msg in messages:
-            role = msg.get("role")
-            content = msg.get("content", "")
-
-            if role == "system":
-                langchain_messages.append(SystemMessage(content=content))
-            elif role == "user":
-                langchain_messages.append(HumanMessage(content=content))
-            elif role == "assistant":
-                langchain_messages.append(AIMessage(content=content))
-
-        return langchain_messages
+    def _get_llm(self, model_id: str) -> ChatOpenAI:
+        try:
+            return self._llm_cache[model_id]
+        except KeyError:
+            raise ValueError(f"Model '{model_id}' is not used by this pipeline configuration") from None
 
     def _format_history_for_query_rewrite(self, messages: List[Dict[str, str]]) -> str:
         """Format conversation history for query rewriting (excludes the last user message)"""
@@ -78,46 +118,81 @@ class PipelineService:
         history = self._format_history_for_query_rewrite(messages)
         question = messages[-1].get("content", "")
 
-        system_message = SystemMessage(content=query_config.system_prompt)
         user_content = query_config.user_prompt_template.format(
             history=history,
             question=question
         )
-        user_message = HumanMessage(content=user_content)
 
-        response = llm.invoke([system_message, user_message])
+        response = llm.invoke([("system", query_config.system_prompt), ("user", user_content)])
         return response.content.strip()
 
-    def _run_prompt_with_history(self, prompt_config: PromptConfig, messages: List[Dict[str, str]], **kwargs) -> str:
-        """Run prompt with conversation history for main inference"""
-        llm = self._get_llm(prompt_config.model)
-
-        # Convert conversation history to LangChain format
-        conversation_messages = self._convert_messages_to_langchain(messages[:-1])  # All but last message
+    def build_history(self, messages: List[Dict[str, str]]) -> List[PromptMessage]:
+        """Convert the conversation history (all but the last message) for the main prompt
+
+        Independent of the retrieved context, so callers can prepare it while the
+        vector search is still running and hand it to run_pipeline.
+        """
+        return [
+            (role, msg.get("content", ""))
+            for msg in messages[:-1]
+            if (role := msg.get("role")) in _HISTORY_ROLES
+        ]
+
+    def _history_prompt_messages(
+        self,
+        prompt_config: PromptConfig,
+        messages: List[Dict[str, str]],
+        history: Optional[List[PromptMessage]] = None,
+        **kwargs,
+    ) -> List[PromptMessage]:
+        """Build the main prompt message list with conversation history"""
+        if history is None:
+            history = self.build_history(messages)
 
         # Add system prompt
-        system_message = SystemMessage(content=prompt_config.system_prompt)
-        all_messages = [system_message] + conversation_messages
+        all_messages = [("system", prompt_config.system_prompt)] + history
 
         # Format the last user message with context
         last_user_message = messages[-1]
-        user_content = prompt_config.user_prompt_template.format(
-            question=last_user_message.get("content", ""),
-            **kwargs
-        )
-        all_messages.append(HumanMessage(content=user_content))
-
-        response = llm.invoke(all_messages)
+        # kwargs is already a fresh dict; format_map uses it as-is instead of
+        # re-packing keyword arguments
+        kwargs["question"] = last_user_message.get("content", "")
+        user_content = prompt_config.user_prompt_template.format_map(kwargs)
+        all_messages.append(("user", user_content))
+        return all_messages
+
+    def _run_prompt_with_history(
+        self,
+        prompt_config: PromptConfig,
+        messages: List[Dict[str, str]],
+        history: Optional[List[PromptMessage]] = None,
+        **kwargs,
+    ) -> str:
+        """Run prompt with conversation history for main inference"""
+        llm = self._get_llm(prompt_config.model)
+        response = llm.invoke(self._history_prompt_messages(prompt_config, messages, history, **kwargs))
         return response.content
 
+    def _stream_prompt_with_history(
+        self,
+        prompt_config: PromptConfig,
+        messages: List[Dict[str, str]],
+        history: Optional[List[PromptMessage]] = None,
+        **kwargs,
+    ) -> Iterator[str]:
+        """Stream the main inference output as the model produces it"""
+        llm = self._get_llm(prompt_config.model)
+        for chunk in llm.stream(self._history_prompt_messages(prompt_config, messages, history, **kwargs)):
+            # Text models stream str content; skip empty and non-text (block list) chunks
+            if isinstance(chunk.content, str) and chunk.content:
+                yield chunk.content
+
     def _run_prompt(self, prompt_config: PromptConfig, **kwargs) -> str:
         llm = self._get_llm(prompt_config.model)
 
-        system_message = SystemMessage(content=prompt_config.system_prompt)
-        user_content = prompt_config.user_prompt_template.format(**kwargs)
-        user_message = HumanMessage(content=user_content)
+        user_content = prompt_config.user_prompt_template.format_map(kwargs)
 
-        response = llm.invoke([system_message, user_message])
+        response = llm.invoke([("system", prompt_config.system_prompt), ("user", user_content)])
         return response.content
 
     def _run_gate_prompt(
@@ -125,15 +200,15 @@ class PipelineService:
     ) -> Tuple[bool, Optional[str]]:
         llm = self._get_llm(gate_config.model)
 
-        system_message = SystemMessage(content=gate_config.system_prompt)
         user_content = gate_config.user_prompt_template.format(response=response)
-        user_message = HumanMessage(content=user_content)
 
-        result = llm.invoke([system_message, user_message]).content.strip()
+        result = llm.invoke([("system", gate_config.system_prompt), ("user", user_content)]).content.strip()
 
-        if result.upper().startswith("PASS"):
+        # Only the verdict prefix needs case folding, not the whole response
+        head = result[:6].upper()
+        if head.startswith("PASS"):
             return True, None
-        elif result.upper().startswith("REJECT"):
+        elif head == "REJECT":
             reject_reason = (
                 result[6:].strip() if len(result) > 6 else "No reason provided"
             )
@@ -146,37 +221,52 @@ class PipelineService:
     ) -> str:
         llm = self._get_llm(fix_config.model)
 
-        system_message = SystemMessage(content=fix_config.system_prompt)
         user_content = fix_config.user_prompt_template.format(
             response=response, reject_reason=reject_reason
         )
-        user_message = HumanMessage(content=user_content)
 
-        return llm.invoke([system_message, user_message]).content
+        return llm.invoke([("system", fix_config.system_prompt), ("user", user_content)]).content
+
+    def _rewrite_prompt_messages(
+        self, rewrite_config: RewritePromptConfig, response: str
+    ) -> List[PromptMessage]:
+        user_content = rewrite_config.user_prompt_template.format(response=response)
+        return [("system", rewrite_config.system_prompt), ("user", user_content)]
 
     def _run_rewrite_prompt(
         self, rewrite_config: RewritePromptConfig, response: str
     ) -> str:
         llm = self._get_llm(rewrite_config.model)
+        return llm.invoke(self._rewrite_prompt_messages(rewrite_config, response)).content
 
-        system_message = SystemMessage(content=rewrite_config.system_prompt)
-        user_content = rewrite_config.user_prompt_template.format(response=response)
-        user_message = HumanMessage(content=user_content)
-
-        return llm.invoke([system_message, user_message]).content
-
-    def run_pipeline(self, messages: List[Dict[str, str]], context: str) -> str:
-        # Use conversation history for main prompt
-        response = self._run_prompt_with_history(
-            self.config.main_prompt, messages, context=context
-        )
-
+    def _stream_rewrite_prompt(
+        self, rewrite_config: RewritePromptConfig, response: str
+    ) -> Iterator[str]:
+        llm = self._get_llm(rewrite_config.model)
+        for chunk in llm.stream(self._rewrite_prompt_messages(rewrite_config, response)):
+            # Text models stream str content; skip empty and non-text (block list) chunks
+            if isinstance(chunk.content, str) and chunk.content:
+                yield chunk.content
+
+    def _check_gates(self, response: str) -> List[Tuple[bool, Optional[str]]]:
+        """Run every gate against the same response, concurrently when there are several"""
+        gate_prompts = self.config.gate_prompts
+        if len(gate_prompts) == 1:
+            return [self._run_gate_prompt(gate_prompts[0], response)]
+
+        futures = [
+            _gate_executor.submit(self._run_gate_prompt, gate_config, response)
+            for gate_config in gate_prompts
+        ]
+        return [future.result() for future in futures]
+
+    def _run_gates(self, response: str) -> str:
         for attempt in range(self.config.max_retries):
             all_gates_passed = True
 
-            for gate_config in self.config.gate_prompts:
-                passed, reject_reason = self._run_gate_prompt(gate_config, response)
-
+            # The first rejecting gate (in configuration order) gets its fix applied
+            results = self._check_gates(response)
+            for gate_config, (passed, reject_reason) in zip(self.config.gate_prompts, results):
                 if not passed:
                     all_gates_passed = False
                     if gate_config.fix_prompt:
@@ -188,7 +278,57 @@ class PipelineService:
             if all_gates_passed:
                 break
 
+        return response
+
+    def run_pipeline(
+        self,
+        messages: List[Dict[str, str]],
+        context: str,
+        history: Optional[List[PromptMessage]] = None,
+    ) -> str:
+        # Use conversation history for main prompt
+        response = self._run_prompt_with_history(
+            self.config.main_prompt, messages, history, context=context
+        )
+
+        if self.config.gate_prompts:
+            response = self._run_gates(response)
+
         for rewrite_config in self.config.rewrite_prompts:
             response = self._run_rewrite_prompt(rewrite_config, response)
 
         return response
+
+    def run_pipeline_stream(
+        self,
+        messages: List[Dict[str, str]],
+        context: str,
+        history: Optional[List[PromptMessage]] = None,
+    ) -> Iterator[str]:
+        """Run the pipeline, yielding the final stage's output as it is generated
+
+        Only the last stage can be streamed: gates and earlier rewrites need the
+        complete response, so they still run to completion first.
+        """
+        if not self.config.gate_prompts and not self.config.rewrite_prompts:
+            yield from self._stream_prompt_with_history(
+                self.config.main_prompt, messages, history, context=context
+            )
+            return
+
+        response = self._run_prompt_with_history(
+            self.config.main_prompt, messages, history, context=context
+        )
+
+        if self.config.gate_prompts:
+            response = self._run_gates(response)
+
+        if not self.config.rewrite_prompts:
+            yield response
+            return
+
+        *leading_rewrites, last_rewrite = self.config.rewrite_prompts
+        for rewrite_config in leading_rewrites:
+            response = self._run_rewrite_prompt(rewrite_config, response)
+
+        yield from self._stream_rewrite_prompt(last_rewrite, response)
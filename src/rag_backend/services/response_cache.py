@@ -0,0 +1,44 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+CacheKey = Tuple[str, str, str]
+
+
+class ResponseCache:
+    """LRU of final pipeline responses for exact repeat requests
+
+    Requests match when they target the same configuration, their last message is
+    equal after stripping and lowercasing, and the preceding conversation is
+    identical.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, Any]]) -> CacheKey:
+        normalized = str(messages[-1].get("content", "")).strip().lower()
+        history_digest = hashlib.blake2b(
+            orjson.dumps(messages[:-1]), digest_size=16
+        ).hexdigest()
+        return model, normalized, history_digest
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: CacheKey, response: str) -> None:
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
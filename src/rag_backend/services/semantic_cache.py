@@ -0,0 +1,60 @@
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticContextCache:
+    """LRU cache of retrieved contexts keyed by query embedding
+
+    A lookup hits when a stored query embedding has cosine similarity of at least
+    ``threshold`` with the new one, so paraphrased questions reuse the context
+    retrieved for an earlier query instead of running another vector search.
+    """
+
+    def __init__(self, capacity: int, threshold: float):
+        self.capacity = capacity
+        self.threshold = threshold
+        # Unit-length query embeddings, allocated on first put once the dimension is known
+        self._keys: Optional[np.ndarray] = None
+        self._values: List[Optional[str]] = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: Sequence[float]) -> Optional[str]:
+        """Return the context of the most similar cached query, or None on a miss"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._keys is None:
+                return None
+            scores = self._keys[: self._size] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return self._values[best]
+
+    def put(self, embedding: Sequence[float], context: str) -> None:
+        """Store context for a query embedding, evicting the least recently used entry"""
+        key = self._normalize(embedding)
+        with self._lock:
+            if self._keys is None:
+                self._keys = np.zeros((self.capacity, key.shape[0]), dtype=np.float32)
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._keys[slot] = key
+            self._values[slot] = context
+            self._clock += 1
+            self._last_used[slot] = self._clock
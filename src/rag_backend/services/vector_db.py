@@ -1,33 +1,70 @@
-import json
+import os
 import pickle
-from typing import List, Dict, Optional
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
+import orjson
 from langchain_ollama import OllamaEmbeddings
 from langchain_chroma import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-from ..models.config import VectorDBConfig
+from ..models.config import VectorDBConfig, SemanticCacheConfig
+from .semantic_cache import SemanticContextCache
+
+# Read buffer for Q&A JSONL files; lines go to orjson as raw bytes
+_JSONL_READ_BUFFER = 1 << 20
+
+# One embeddings client (and HTTP connection pool) per Ollama model and server,
+# shared by all configurations that use them
+_embeddings_cache: Dict[Tuple[str, str], OllamaEmbeddings] = {}
+_embeddings_lock = threading.Lock()
+
+
+def _get_embeddings(model: str, base_url: str) -> OllamaEmbeddings:
+    key = (model, base_url)
+    with _embeddings_lock:
+        embeddings = _embeddings_cache.get(key)
+        if embeddings is None:
+            embeddings = OllamaEmbeddings(model=model, base_url=base_url)
+            _embeddings_cache[key] = embeddings
+    return embeddings
+
+
+@lru_cache(maxsize=16)
+def _get_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Splitters are stateless, so configurations with the same chunking share one"""
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
 
 class VectorDBService:
-    def __init__(self, config: VectorDBConfig, data_dir: str):
+    def __init__(
+        self,
+        config: VectorDBConfig,
+        data_dir: str,
+        semantic_cache_config: Optional[SemanticCacheConfig] = None,
+    ):
         self.config = config
         self.data_dir = Path(data_dir)
         self.persist_directory = self.data_dir / ".chroma_db"
 
-        self.embeddings = OllamaEmbeddings(
-            model=config.embedding_model,
-            base_url=config.ollama_base_url,
-        )
+        self.embeddings = _get_embeddings(config.embedding_model, config.ollama_base_url)
 
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap
-        )
+        self.text_splitter = _get_text_splitter(config.chunk_size, config.chunk_overlap)
 
         self.vectorstore: Optional[Chroma] = None
-        self.qa_pairs: List[Dict[str, str]] = []
+        # Loaded from the persisted index on first access to qa_pairs
+        self._qa_pairs: Optional[List[Dict[str, str]]] = None
+
+        self.context_cache: Optional[SemanticContextCache] = None
+        if semantic_cache_config is not None and semantic_cache_config.enabled:
+            self.context_cache = SemanticContextCache(
+                capacity=semantic_cache_config.capacity,
+                threshold=semantic_cache_config.similarity_threshold,
+            )
 
     def index_exists(self) -> bool:
         return self.persist_directory.exists() and any(self.persist_directory.iterdir())
@@ -39,13 +76,12 @@ class VectorDBService:
                 embedding_function=self.embeddings,
                 persist_directory=str(self.persist_directory),
             )
-            self._load_qa_pairs()
         else:
             self._create_index()
 
     def _create_index(self) -> None:
         documents = []
-        self.qa_pairs = []
+        self._qa_pairs = []
 
         print(f"Creating index for data directory: {self.data_dir}")
         print(f"Persist directory will be: {self.persist_directory}")
@@ -54,35 +90,52 @@ class VectorDBService:
             print(f"Warning: Data directory {self.data_dir} does not exist")
             self.data_dir.mkdir(parents=True, exist_ok=True)
 
-        for file_path in self.data_dir.iterdir():
-            if file_path.suffix == ".txt":
-                print(f"Processing {file_path.name}")
-                content = file_path.read_text(encoding="utf-8")
-                docs = self.text_splitter.create_documents(
-                    [content], metadatas=[{"source": file_path.name, "type": "text"}]
+        # One directory pass, files grouped by suffix (same rule as Path.suffix)
+        files_by_suffix: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    files_by_suffix[os.path.splitext(entry.name)[1]].append((entry.name, entry.path))
+
+        # All text files are split in one create_documents call
+        texts: List[str] = []
+        text_metadatas: List[Dict[str, str]] = []
+        for name, path in files_by_suffix[".txt"]:
+            print(f"Processing {name}")
+            with open(path, "r", encoding="utf-8") as f:
+                texts.append(f.read())
+            text_metadatas.append({"source": name, "type": "text"})
+
+        if texts:
+            documents.extend(self.text_splitter.create_documents(texts, metadatas=text_metadatas))
+
+        loads = orjson.loads
+        qa_append = self._qa_pairs.append
+        for name, path in files_by_suffix[".jsonl"]:
+            print(f"Processing {name}")
+            file_qa_pairs: List[Dict[str, str]] = []
+            file_qa_append = file_qa_pairs.append
+            with open(path, "rb", buffering=_JSONL_READ_BUFFER) as f:
+                for line in f:
+                    try:
+                        qa_pair = loads(line)
+                    except orjson.JSONDecodeError:
+                        continue
+                    if "question" in qa_pair and "answer" in qa_pair:
+                        qa_append(qa_pair)
+                        file_qa_append(qa_pair)
+
+            documents.extend([
+                Document(
+                    page_content=f"Question: {qa_pair['question']}\nAnswer: {qa_pair['answer']}",
+                    metadata={
+                        "source": name,
+                        "type": "qa",
+                        "question": qa_pair["question"],
+                    },
                 )
-                documents.extend(docs)
-
-            elif file_path.suffix == ".jsonl":
-                print(f"Processing {file_path.name}")
-                with open(file_path, "r", encoding="utf-8") as f:
-                    for line in f:
-                        try:
-                            qa_pair = json.loads(line.strip())
-                            if "question" in qa_pair and "answer" in qa_pair:
-                                self.qa_pairs.append(qa_pair)
-                                combined_text = f"Question: {qa_pair['question']}\nAnswer: {qa_pair['answer']}"
-                                doc = Document(
-                                    page_content=combined_text,
-                                    metadata={
-                                        "source": file_path.name,
-                                        "type": "qa",
-                                        "question": qa_pair["question"],
-                                    },
-                                )
-                                documents.append(doc)
-                        except json.JSONDecodeError:
-                            continue
+                for qa_pair in file_qa_pairs
+            ])
 
         if documents:
             self.vectorstore = Chroma.from_documents(
@@ -105,29 +158,38 @@ class VectorDBService:
     def _save_qa_pairs(self) -> None:
         # Ensure the persist directory exists
         self.persist_directory.mkdir(parents=True, exist_ok=True)
-        qa_pairs_file = self.persist_directory / "qa_pairs.pkl"
+        qa_pairs_file = self.persist_directory / "qa_pairs.json"
         with open(qa_pairs_file, "wb") as f:
-            pickle.dump(self.qa_pairs, f)
+            f.write(orjson.dumps(self._qa_pairs))
 
     def _load_qa_pairs(self) -> None:
-        qa_pairs_file = self.persist_directory / "qa_pairs.pkl"
+        qa_pairs_file = self.persist_directory / "qa_pairs.json"
         if qa_pairs_file.exists():
             with open(qa_pairs_file, "rb") as f:
-                self.qa_pairs = pickle.load(f)
+                self._qa_pairs = orjson.loads(f.read())
+            return
+
+        # Indexes built before the switch to JSON: convert once, then drop the pickle
+        legacy_file = self.persist_directory / "qa_pairs.pkl"
+        if legacy_file.exists():
+            with open(legacy_file, "rb") as f:
+                self._qa_pairs = pickle.load(f)
+            self._save_qa_pairs()
+            legacy_file.unlink()
+        else:
+            self._qa_pairs = []
 
-    def search(self, query: str) -> List[Document]:
-        if not self.vectorstore:
-            return []
+    @property
+    def qa_pairs(self) -> List[Dict[str, str]]:
+        if self._qa_pairs is None:
+            self._load_qa_pairs()
+            assert self._qa_pairs is not None
+        return self._qa_pairs
 
+    def search(self, query: str) -> List[Document]:
         if self.config.use_mmr:
-            return self.vectorstore.max_marginal_relevance_search(
-                query,
-                k=self.config.top_k,
-                fetch_k=self.config.mmr_fetch_k,
-                lambda_mult=self.config.mmr_lambda
-            )
-        else:
-            return self.vectorstore.similarity_search(query, k=self.config.top_k)
+            return self.search_mmr(query)
+        return self.search_similarity(query)
 
     def search_mmr(self, query: str, lambda_mult: float = None) -> List[Document]:
         """Search using MMR regardless of config setting"""
@@ -149,16 +211,37 @@ class VectorDBService:
 
         return self.vectorstore.similarity_search(query, k=self.config.top_k)
 
-    def get_context(self, query: str) -> str:
-        documents = self.search(query)
-        context_parts = []
-
-        for doc in documents:
-            if doc.metadata.get("type") == "qa":
-                context_parts.append(doc.page_content)
-            else:
-                context_parts.append(
-                    f"From {doc.metadata.get('source', 'unknown')}:\n{doc.page_content}"
-                )
+    def _search_by_vector(self, embedding: List[float]) -> List[Document]:
+        """Same as search(), for an already embedded query"""
+        if not self.vectorstore:
+            return []
 
-        return "\n\n---\n\n".join(context_parts)
+        if self.config.use_mmr:
+            return self.vectorstore.max_marginal_relevance_search_by_vector(
+                embedding,
+                k=self.config.top_k,
+                fetch_k=self.config.mmr_fetch_k,
+                lambda_mult=self.config.mmr_lambda
+            )
+        else:
+            return self.vectorstore.similarity_search_by_vector(embedding, k=self.config.top_k)
+
+    def _format_context(self, documents: List[Document]) -> str:
+        return "\n\n---\n\n".join(
+            doc.page_content
+            if (metadata := doc.metadata).get("type") == "qa"
+            else f"From {metadata.get('source', 'unknown')}:\n{doc.page_content}"
+            for doc in documents
+        )
+
+    def get_context(self, query: str) -> str:
+        if self.context_cache is None:
+            return self._format_context(self.search(query))
+
+        # Embed once and use the vector both for the cache lookup and the search on a miss
+        embedding = self.embeddings.embed_query(query)
+        context = self.context_cache.get(embedding)
+        if context is None:
+            context = self._format_context(self._search_by_vector(embedding))
+            self.context_cache.put(embedding, context)
+        return context
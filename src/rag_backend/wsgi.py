@@ -0,0 +1,29 @@
+"""WSGI entrypoint for production servers, e.g. gunicorn -k gevent src.rag_backend.wsgi:app
+
+The configuration is taken from RAG_BACKEND_CONFIG_JSON when set (that is how the
+CLI passes it on, with its overrides applied), otherwise it is read from the file
+named by RAG_BACKEND_CONFIG (default: config.json).
+"""
+from gevent import monkey
+from gevent.threadpool import ThreadPoolExecutor
+
+# Must run before anything below imports socket/threading
+monkey.patch_all()
+
+import os  # noqa: E402
+
+from .app import CONFIG_JSON_ENV, create_app, load_config  # noqa: E402
+from .models.config import Config  # noqa: E402
+
+_config_json = os.getenv(CONFIG_JSON_ENV)
+if _config_json is not None:
+    config = Config.model_validate_json(_config_json)
+else:
+    config = load_config(os.getenv("RAG_BACKEND_CONFIG", "config.json"))
+
+# Under patch_all the pipeline executor runs greenlets, which suits the network-bound
+# LLM calls; the vector search blocks in C, so it gets native threads of its own
+app = create_app(
+    config=config,
+    search_executor=ThreadPoolExecutor(max_workers=config.server_config.pipeline_max_workers),
+)
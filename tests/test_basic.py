@@ -1,144 +1,433 @@
-from unittest.mock import Mock, patch
+from collections import Counter
+from functools import lru_cache
+from types import SimpleNamespace
 
-from src.rag_backend.models.config import Config
+import orjson
+import pytest
+from pydantic import ValidationError
 
+import src.rag_backend.app as app_module
+from src.rag_backend.api import completions
+from src.rag_backend.app import create_app
+from src.rag_backend.models.config import (
+    Config,
+    ConfigurationEntry,
+    ModelConfig,
+    PipelineConfig,
+    PromptConfig,
+    VectorDBConfig,
+)
 
-def test_config_loading():
-    config_data = {
-        "venice_api_base": "https://api.venice.ai/api/v1",
-        "models": {
-            "test-model": {
-                "name": "gpt-3.5-turbo",
-                "temperature": 0.7
-            }
+
+def _build_config(config_data):
+    """Construct a Config from trusted test data without running validation"""
+    def build_entry(entry):
+        pipeline = entry["pipeline_config"]
+        return ConfigurationEntry.model_construct(
+            data_directory=entry["data_directory"],
+            vector_db_config=VectorDBConfig.model_construct(**entry["vector_db_config"]),
+            pipeline_config=PipelineConfig.model_construct(
+                **{**pipeline, "main_prompt": PromptConfig.model_construct(**pipeline["main_prompt"])}
+            ),
+        )
+
+    return Config.model_construct(
+        venice_api_base=config_data["venice_api_base"],
+        models={name: ModelConfig.model_construct(**model) for name, model in config_data["models"].items()},
+        configurations={name: build_entry(entry) for name, entry in config_data["configurations"].items()},
+    )
+
+
+# Leaves shared by reference between the config constants; tests never mutate them
+_MODELS = {"test-model": {"name": "gpt-3.5-turbo", "temperature": 0.7}}
+_NO_PROMPTS = ()
+
+
+class _FrozenDict(tuple):
+    """Hashable stand-in for a dict: its sorted (key, frozen value) items
+
+    Compares and hashes with its type, so {} and [] (both freeze to empty tuples)
+    stay different cache keys.
+    """
+
+    def __eq__(self, other):
+        return type(other) is _FrozenDict and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((_FrozenDict, tuple(self)))
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _unfreeze(value):
+    if isinstance(value, _FrozenDict):
+        return {key: _unfreeze(item) for key, item in value}
+    if isinstance(value, tuple):
+        return [_unfreeze(item) for item in value]
+    return value
+
+
+@lru_cache(maxsize=16)
+def _make_config(frozen_config_data):
+    """Cached _build_config for frozen test data; callers must treat the result as read-only"""
+    return _build_config(_unfreeze(frozen_config_data))
+
+
+def _entry(data_dir, collection, chunk_size, overlap, top_k, prompt, retries):
+    return {
+        "data_directory": data_dir,
+        "vector_db_config": {
+            "collection_name": collection,
+            "embedding_model": "text-embedding-3-small",
+            "chunk_size": chunk_size,
+            "chunk_overlap": overlap,
+            "top_k": top_k,
         },
-        "configurations": {
-            "default": {
-                "data_directory": "data",
-                "vector_db_config": {
-                    "collection_name": "test_collection",
-                    "embedding_model": "text-embedding-3-small",
-                    "chunk_size": 500,
-                    "chunk_overlap": 50,
-                    "top_k": 5,
-                },
-                "pipeline_config": {
-                    "main_prompt": {
-                        "system_prompt": "Test system prompt",
-                        "user_prompt_template": "Test {question} with {context}",
-                        "model": "test-model",
-                    },
-                    "gate_prompts": [],
-                    "rewrite_prompts": [],
-                    "max_retries": 2,
-                }
-            }
+        "pipeline_config": {
+            "main_prompt": {
+                "system_prompt": f"{prompt} system prompt",
+                "user_prompt_template": f"{prompt} {{question}} with {{context}}",
+                "model": "test-model",
+            },
+            "gate_prompts": _NO_PROMPTS,
+            "rewrite_prompts": _NO_PROMPTS,
+            "max_retries": retries,
         }
     }
 
-    config = Config(**config_data)
+
+_DEFAULT_ENTRY = _entry("data", "test_collection", 500, 50, 5, "Test", 2)
+
+_SINGLE_CFG = {
+    "venice_api_base": "https://api.venice.ai/api/v1",
+    "models": _MODELS,
+    "configurations": {"default": _DEFAULT_ENTRY},
+}
+
+_MULTI_CFG = {
+    **_SINGLE_CFG,
+    "configurations": {
+        "default": _DEFAULT_ENTRY,
+        "liberation": _entry("data-liberation", "liberation_collection", 300, 30, 3, "Liberation", 1),
+    },
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm_config_schema():
+    # Config validators are built on first use; pay that once for the session
+    Config.model_validate(_SINGLE_CFG)
+
+
+@pytest.mark.parametrize(
+    "config_data,expected",
+    [
+        (_SINGLE_CFG, {"default": ("data", "test_collection", "Test system prompt")}),
+        (
+            _MULTI_CFG,
+            {
+                "default": ("data", "test_collection", "Test system prompt"),
+                "liberation": ("data-liberation", "liberation_collection", "Liberation system prompt"),
+            },
+        ),
+    ],
+    ids=["single", "multi"],
+)
+def test_configurations(config_data, expected):
+    config = _make_config(_freeze(config_data))
     assert config.venice_api_base == "https://api.venice.ai/api/v1"
-    assert "default" in config.configurations
-    assert config.configurations["default"].data_directory == "data"
-    assert config.configurations["default"].vector_db_config.collection_name == "test_collection"
-    assert config.configurations["default"].pipeline_config.main_prompt.system_prompt == "Test system prompt"
+    assert set(config.configurations) == set(expected)
+    for name, (data_directory, collection_name, system_prompt) in expected.items():
+        entry = config.configurations[name]
+        assert entry.data_directory == data_directory
+        assert entry.vector_db_config.collection_name == collection_name
+        assert entry.pipeline_config.main_prompt.system_prompt == system_prompt
 
 
-def test_multi_config_loading():
+def test_config_validation():
     config_data = {
-        "venice_api_base": "https://api.venice.ai/api/v1",
-        "models": {
-            "test-model": {
-                "name": "gpt-3.5-turbo",
-                "temperature": 0.7
-            }
-        },
+        "models": {"test-model": {"name": "gpt-3.5-turbo"}},
         "configurations": {
             "default": {
-                "data_directory": "data",
-                "vector_db_config": {
-                    "collection_name": "test_collection",
-                    "embedding_model": "text-embedding-3-small",
-                    "chunk_size": 500,
-                    "chunk_overlap": 50,
-                    "top_k": 5,
-                },
+                "vector_db_config": {},
                 "pipeline_config": {
                     "main_prompt": {
                         "system_prompt": "Test system prompt",
                         "user_prompt_template": "Test {question} with {context}",
                         "model": "test-model",
                     },
-                    "gate_prompts": [],
-                    "rewrite_prompts": [],
-                    "max_retries": 2,
-                }
-            },
-            "liberation": {
-                "data_directory": "data-liberation",
-                "vector_db_config": {
-                    "collection_name": "liberation_collection",
-                    "embedding_model": "text-embedding-3-small",
-                    "chunk_size": 300,
-                    "chunk_overlap": 30,
-                    "top_k": 3,
+                    "gate_prompts": [
+                        {
+                            "name": "gate",
+                            "system_prompt": "Gate",
+                            "user_prompt_template": "{response}",
+                            "model": "test-model",
+                            "fix_prompt": {
+                                "system_prompt": "Fix",
+                                "user_prompt_template": "{response} {reject_reason}",
+                                "model": "test-model",
+                            },
+                        }
+                    ],
                 },
-                "pipeline_config": {
-                    "main_prompt": {
-                        "system_prompt": "Liberation system prompt",
-                        "user_prompt_template": "Liberation {question} with {context}",
-                        "model": "test-model",
-                    },
-                    "gate_prompts": [],
-                    "rewrite_prompts": [],
-                    "max_retries": 1,
-                }
             }
-        }
+        },
     }
 
-    config = Config(**config_data)
-    assert config.venice_api_base == "https://api.venice.ai/api/v1"
-    assert len(config.configurations) == 2
-    assert "default" in config.configurations
-    assert "liberation" in config.configurations
-    assert config.configurations["default"].data_directory == "data"
-    assert config.configurations["liberation"].data_directory == "data-liberation"
-    assert config.configurations["default"].vector_db_config.collection_name == "test_collection"
-    assert config.configurations["liberation"].vector_db_config.collection_name == "liberation_collection"
-
-
-def test_api_endpoint():
-    with patch.dict("os.environ", {"VENICE_API_KEY": "test-key"}):
-        from src.rag_backend.app import create_app
-
-        mock_vector_db = Mock()
-        mock_vector_db.load_or_create_index = Mock()
-        mock_vector_db.get_context = Mock(return_value="Test context")
-
-        mock_pipeline = Mock()
-        mock_pipeline.run_pipeline = Mock(return_value="Test response")
-
-        mock_config_manager = Mock()
-        mock_config_manager.has_configuration = Mock(return_value=True)
-        mock_config_manager.get_vector_db_service = Mock(return_value=mock_vector_db)
-        mock_config_manager.get_pipeline_service = Mock(return_value=mock_pipeline)
-        mock_config_manager.get_available_models = Mock(return_value=["default"])
-
-        with patch("src.rag_backend.app.ConfigurationManager", return_value=mock_config_manager):
-            app = create_app("config.json", reindex=False)
-            client = app.test_client()
-
-            response = client.post(
-                "/v1/chat/completions",
-                json={
-                    "messages": [{"role": "user", "content": "Test question"}],
-                    "stream": False,
-                    "model": "default"
-                },
-            )
+    config = Config.model_validate(config_data)
+    entry = config.configurations["default"]
+    assert isinstance(entry.vector_db_config, VectorDBConfig)
+    assert entry.vector_db_config.top_k == 5
+    assert entry.pipeline_config.gate_prompts[0].fix_prompt.system_prompt == "Fix"
+    assert config.models["test-model"].temperature == 0.7
+
+    config_data["models"]["test-model"]["temperature"] = 5
+    with pytest.raises(ValidationError):
+        Config.model_validate(config_data)
+
+
+_CHAT_REQUEST = {
+    "messages": [{"role": "user", "content": "Test question"}],
+    "stream": False,
+    "model": "default"
+}
+# Request bodies are serialized once rather than on every post
+_CHAT_BODY = orjson.dumps(_CHAT_REQUEST)
+_STREAM_CHAT_BODY = orjson.dumps({**_CHAT_REQUEST, "stream": True})
+
+# Deterministic part of the completion body; id and created vary per request
+_EXPECTED_RESPONSE = {
+    "object": "chat.completion",
+    "model": "default",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "Test response"},
+            "finish_reason": "stop",
+        }
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Plain fakes: the tests only check responses, never calls on the services
+    fake_vector_db = SimpleNamespace(
+        load_or_create_index=lambda *args, **kwargs: None,
+        get_context=lambda *args, **kwargs: "Test context",
+    )
+
+    fake_pipeline = SimpleNamespace(
+        build_history=lambda *args, **kwargs: [],
+        run_pipeline=lambda *args, **kwargs: "Test response",
+        run_pipeline_stream=lambda *args, **kwargs: iter(["Test", " response"]),
+    )
+
+    fake_config_manager = SimpleNamespace(
+        has_configuration=lambda model_name: True,
+        get_vector_db_service=lambda model_name: fake_vector_db,
+        get_pipeline_service=lambda model_name: fake_pipeline,
+        get_query_rewrite_config=lambda model_name: None,
+        get_available_models=lambda: ["default"],
+    )
+
+    # The monkeypatch fixture is function scoped; a module fixture needs its own context
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("VENICE_API_KEY", "test-key")
+        mp.setattr(app_module, "ConfigurationManager", lambda *args, **kwargs: fake_config_manager)
+
+        app = create_app("config.json", reindex=False)
+        app.config.update(TESTING=True)
+        app.logger.disabled = True
+        yield app.test_client()
+
+
+def test_api_endpoint(client):
+    response = client.post("/v1/chat/completions", data=_CHAT_BODY, content_type="application/json")
+
+    assert response.status_code == 200
+    data = orjson.loads(response.data)
+    assert {key: data[key] for key in _EXPECTED_RESPONSE} == _EXPECTED_RESPONSE
+
+
+def test_api_streaming(client):
+    response = client.post("/v1/chat/completions", data=_STREAM_CHAT_BODY, content_type="application/json")
+
+    assert response.status_code == 200
+    events = [
+        event.removeprefix("data: ")
+        for event in response.get_data(as_text=True).split("\n\n")
+        if event
+    ]
+    assert events[-1] == "[DONE]"
+    chunks = [orjson.loads(event) for event in events[:-1]]
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "Test response"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+
+
+_USER_MESSAGE = {"role": "user", "content": "Test question"}
+
+
+@pytest.mark.parametrize(
+    "body,message",
+    [
+        ({}, "'messages' is required and must be non-empty"),
+        ({"messages": []}, "'messages' is required and must be non-empty"),
+        (
+            {"messages": [{"role": 1, "content": "Test question"}]},
+            "Every message must be an object with a string 'role'",
+        ),
+        (
+            {"messages": [_USER_MESSAGE, {"role": "assistant", "content": "Answer"}]},
+            "Last message must have role 'user'",
+        ),
+        ({"messages": [_USER_MESSAGE], "stream": "true"}, "'stream' must be a boolean or null"),
+    ],
+    ids=["missing-messages", "empty-messages", "non-string-role", "last-not-user", "non-bool-stream"],
+)
+def test_api_rejects_invalid_request(client, body, message):
+    response = client.post("/v1/chat/completions", data=orjson.dumps(body), content_type="application/json")
+
+    assert response.status_code == 400
+    assert orjson.loads(response.data) == {"error": {"message": message, "type": "invalid_request_error"}}
+
+
+def test_api_accepts_null_stream(client):
+    body = orjson.dumps({**_CHAT_REQUEST, "stream": None})
+    response = client.post("/v1/chat/completions", data=body, content_type="application/json")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    data = orjson.loads(response.data)
+    assert {key: data[key] for key in _EXPECTED_RESPONSE} == _EXPECTED_RESPONSE
+
+
+def test_exec_gunicorn_passes_config_through_environment(monkeypatch):
+    config = Config.model_validate(_SINGLE_CFG)
+    config.server_config.port = 9090
+    config.server_config.workers = 3
+    # Recorded by monkeypatch (delenv on an unset variable is not), so the value
+    # _exec_gunicorn writes is removed again afterwards
+    monkeypatch.setenv(app_module.CONFIG_JSON_ENV, "")
+    calls = []
+    monkeypatch.setattr(app_module.os, "execv", lambda path, argv: calls.append((path, argv)))
+
+    app_module._exec_gunicorn(config)
+
+    [(path, argv)] = calls
+    assert path == app_module.sys.executable
+    assert argv == [
+        app_module.sys.executable, "-m", "gunicorn",
+        "--worker-class", "gevent",
+        "--workers", "3",
+        "--worker-connections", "1000",
+        "--bind", f"{config.server_config.host}:9090",
+        "src.rag_backend.wsgi:app",
+    ]
+    assert Config.model_validate_json(app_module.os.environ[app_module.CONFIG_JSON_ENV]) == config
+
+
+def test_static_cors_single_origin(monkeypatch):
+    config = Config.model_validate(
+        {**_SINGLE_CFG, "server_config": {"cors": {"origins": ["https://app.example"]}}}
+    )
+    monkeypatch.setenv("VENICE_API_KEY", "test-key")
+    # Only the CORS hook is under test; leave the API module's globals alone
+    monkeypatch.setattr(app_module, "ConfigurationManager", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, "init_configuration_manager", lambda *args, **kwargs: None)
+    cors_client = create_app(config=config).test_client()
+
+    matching = cors_client.get("/health", headers={"Origin": "https://app.example"})
+    assert matching.headers["Access-Control-Allow-Origin"] == "https://app.example"
+    assert "Access-Control-Allow-Methods" not in matching.headers
+
+    other = cors_client.get("/health", headers={"Origin": "https://other.example"})
+    assert not any(name.startswith("Access-Control-") for name in other.headers.keys())
+
+    preflight = cors_client.options(
+        "/v1/chat/completions",
+        headers={"Origin": "https://app.example", "Access-Control-Request-Method": "POST"},
+    )
+    assert preflight.status_code == 204
+    assert preflight.headers["Access-Control-Allow-Origin"] == "https://app.example"
+    assert preflight.headers["Access-Control-Allow-Methods"] == "GET, POST, PUT, DELETE, OPTIONS"
+    assert preflight.headers["Access-Control-Allow-Headers"] == "Content-Type, Authorization"
+
+
+@pytest.fixture
+def cached_client(monkeypatch):
+    """App with the response cache enabled, over fakes that count their calls"""
+    calls = Counter()
+
+    def get_context(*args, **kwargs):
+        calls["get_context"] += 1
+        return "Test context"
+
+    def run_pipeline(*args, **kwargs):
+        calls["run_pipeline"] += 1
+        return "Test response"
+
+    def run_pipeline_stream(*args, **kwargs):
+        calls["run_pipeline_stream"] += 1
+        yield from ["Streamed", " response"]
+
+    fake_pipeline = SimpleNamespace(
+        build_history=lambda *args, **kwargs: [],
+        run_pipeline=run_pipeline,
+        run_pipeline_stream=run_pipeline_stream,
+    )
+    fake_config_manager = SimpleNamespace(
+        has_configuration=lambda model_name: True,
+        get_vector_db_service=lambda model_name: SimpleNamespace(get_context=get_context),
+        get_pipeline_service=lambda model_name: fake_pipeline,
+        get_query_rewrite_config=lambda model_name: None,
+        get_available_models=lambda: ["default"],
+    )
+    config = Config.model_validate(
+        {**_SINGLE_CFG, "server_config": {"response_cache": {"enabled": True}}}
+    )
+
+    monkeypatch.setenv("VENICE_API_KEY", "test-key")
+    monkeypatch.setattr(app_module, "ConfigurationManager", lambda *args, **kwargs: fake_config_manager)
+    # create_app installs its manager and cache in the API module; put the module
+    # client's back afterwards
+    for name in (
+        "configuration_manager", "_models_json", "_sse_flush_bytes", "_response_cache", "_search_executor",
+    ):
+        monkeypatch.setattr(completions, name, getattr(completions, name))
+    app = create_app(config=config)
+    app.config.update(TESTING=True)
+    yield app.test_client(), calls
+    completions._services_for.cache_clear()
+
+
+def _post_chat(client, content, stream=False):
+    body = orjson.dumps({"messages": [{"role": "user", "content": content}], "stream": stream})
+    response = client.post("/v1/chat/completions", data=body, content_type="application/json")
+    assert response.status_code == 200
+    return response
+
+
+def test_response_cache_skips_retrieval_and_pipeline(cached_client):
+    client, calls = cached_client
+
+    _post_chat(client, "Test question")
+    repeat = _post_chat(client, "  test QUESTION ")
+    assert orjson.loads(repeat.data)["choices"][0]["message"]["content"] == "Test response"
+    assert calls == {"get_context": 1, "run_pipeline": 1}
 
-            assert response.status_code == 200
-            data = response.get_json()
-            assert data["object"] == "chat.completion"
-            assert data["choices"][0]["message"]["content"] == "Test response"
+    # A streamed miss fills the cache once the stream completes
+    streamed = _post_chat(client, "Stream question", stream=True)
+    assert streamed.get_data(as_text=True).endswith("data: [DONE]\n\n")
+    repeat = _post_chat(client, "stream question")
+    assert orjson.loads(repeat.data)["choices"][0]["message"]["content"] == "Streamed response"
+    assert calls == {"get_context": 2, "run_pipeline": 1, "run_pipeline_stream": 1}
@@ -0,0 +1,23 @@
+import threading
+
+import pytest
+
+from src.rag_backend.services.executor import BoundedExecutor, BusyError
+
+
+def test_bounded_executor_rejects_when_full():
+    executor = BoundedExecutor(max_workers=1, max_pending=2)
+    release = threading.Event()
+    try:
+        first = executor.submit(release.wait)
+        second = executor.submit(release.wait)
+        with pytest.raises(BusyError):
+            executor.submit(release.wait)
+
+        release.set()
+        first.result(timeout=5)
+        second.result(timeout=5)
+        assert executor.submit(lambda: "ok").result(timeout=5) == "ok"
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,25 @@
+from src.rag_backend.services.response_cache import ResponseCache
+
+
+def test_response_cache_normalizes_last_message():
+    cache = ResponseCache(max_entries=2)
+    history = [{"role": "assistant", "content": "Earlier answer"}]
+
+    cache.put(cache.key("default", history + [{"role": "user", "content": "Hello"}]), "Hi!")
+    assert cache.get(cache.key("default", history + [{"role": "user", "content": "  hello "}])) == "Hi!"
+    assert cache.get(cache.key("other", history + [{"role": "user", "content": "hello"}])) is None
+    assert cache.get(cache.key("default", [{"role": "user", "content": "hello"}])) is None
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    keys = [cache.key("default", [{"role": "user", "content": q}]) for q in ("a", "b", "c")]
+
+    cache.put(keys[0], "A")
+    cache.put(keys[1], "B")
+    assert cache.get(keys[0]) == "A"
+    cache.put(keys[2], "C")
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "A"
+    assert cache.get(keys[2]) == "C"
@@ -0,0 +1,22 @@
+from src.rag_backend.services.semantic_cache import SemanticContextCache
+
+
+def test_semantic_cache_hit_and_miss():
+    cache = SemanticContextCache(capacity=4, threshold=0.97)
+    assert cache.get([1.0, 0.0, 0.0]) is None
+
+    cache.put([1.0, 0.0, 0.0], "context a")
+    assert cache.get([2.0, 0.01, 0.0]) == "context a"
+    assert cache.get([0.0, 1.0, 0.0]) is None
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticContextCache(capacity=2, threshold=0.99)
+    cache.put([1.0, 0.0], "a")
+    cache.put([0.0, 1.0], "b")
+    assert cache.get([1.0, 0.0]) == "a"
+
+    cache.put([-1.0, 0.0], "c")
+    assert cache.get([0.0, 1.0]) is None
+    assert cache.get([1.0, 0.0]) == "a"
+    assert cache.get([-1.0, 0.0]) == "c"
@@ -0,0 +1,95 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from src.rag_backend.api import completions
+from src.rag_backend.services.executor import BoundedExecutor, BusyError
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = BoundedExecutor(max_workers=1, max_pending=1)
+    monkeypatch.setattr(completions, "_executor", executor)
+    yield executor
+    executor.shutdown()
+
+
+def _stream(pipeline):
+    tokens = completions._stream_pipeline(pipeline, [{"role": "user", "content": "q"}], "", [])
+    return completions.create_stream_response(
+        tokens, model="default", completion_id="chatcmpl-test", created=0
+    )
+
+
+def _assert_worker_free(executor):
+    """The only worker slot is free again (its release may trail the stop slightly)"""
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            assert executor.submit(lambda: "ok").result(timeout=5) == "ok"
+            break
+        except BusyError:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+def test_stream_error_mid_stream_ends_with_done(executor):
+    def run_pipeline_stream(messages, context, history):
+        yield "partial"
+        raise RuntimeError("upstream failed")
+
+    response = _stream(SimpleNamespace(run_pipeline_stream=run_pipeline_stream))
+    events = [
+        event.removeprefix(b"data: ")
+        for event in b"".join(response.response).split(b"\n\n")
+        if event
+    ]
+
+    assert orjson.loads(events[0])["choices"][0]["delta"]["content"] == "partial"
+    assert orjson.loads(events[-2]) == {"error": "upstream failed"}
+    assert events[-1] == b"[DONE]"
+
+
+def test_stream_client_disconnect_releases_worker(executor):
+    stopped = threading.Event()
+
+    def run_pipeline_stream(messages, context, history):
+        try:
+            for n in itertools.count():
+                yield str(n)
+        finally:
+            stopped.set()
+
+    response = _stream(SimpleNamespace(run_pipeline_stream=run_pipeline_stream))
+    body = iter(response.response)
+    assert next(body).startswith(b"data: ")
+    # What the WSGI server does when the client goes away
+    response.close()
+
+    assert stopped.wait(timeout=5)
+    _assert_worker_free(executor)
+
+
+def test_stream_closed_before_first_read_releases_worker(executor):
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def run_pipeline_stream(messages, context, history):
+        started.set()
+        try:
+            for n in itertools.count():
+                yield str(n)
+        finally:
+            stopped.set()
+
+    response = _stream(SimpleNamespace(run_pipeline_stream=run_pipeline_stream))
+    assert started.wait(timeout=5)
+    # Dropped without ever being read, e.g. by an after_request error
+    response.close()
+
+    assert stopped.wait(timeout=5)
+    _assert_worker_free(executor)
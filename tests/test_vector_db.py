@@ -0,0 +1,22 @@
+import orjson
+
+from src.rag_backend.models.config import VectorDBConfig
+from src.rag_backend.services import vector_db
+from src.rag_backend.services.vector_db import VectorDBService
+
+
+def test_qa_pairs_load_lazily_from_persisted_index(tmp_path, monkeypatch):
+    qa_pairs = [{"question": "What is RAG?", "answer": "Retrieval augmented generation"}]
+    persist_directory = tmp_path / ".chroma_db"
+    persist_directory.mkdir()
+    (persist_directory / "qa_pairs.json").write_bytes(orjson.dumps(qa_pairs))
+    # Opening an existing index must not touch Chroma's files here
+    monkeypatch.setattr(vector_db, "Chroma", lambda **kwargs: kwargs)
+
+    service = VectorDBService(VectorDBConfig(), str(tmp_path))
+    service.load_or_create_index()
+
+    assert service.vectorstore["persist_directory"] == str(persist_directory)
+    assert service._qa_pairs is None
+    assert service.qa_pairs == qa_pairs
+    assert service._qa_pairs == qa_pairs